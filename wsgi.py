@@ -0,0 +1,13 @@
+"""WSGI entry point for production servers.
+
+Run with e.g.:
+    gunicorn -w 1 -k gthread --threads 8 wsgi:app
+
+Keep a single worker: conversation state (STATES in app.py) is held in
+process memory, so extra workers would split a client's turns across
+processes unless you add sticky sessions or an external session store.
+"""
+from app import app
+
+if __name__ == "__main__":
+    app.run(port=5000)